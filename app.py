@@ -1,24 +1,39 @@
 # app.py
 import os
+import re
+import concurrent.futures
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
 import streamlit as st
 import streamlit.components.v1 as components
 from dotenv import load_dotenv
 import markdown as md
+import orjson
+
+# Flow modules and the RAG backend are imported at first use (see _flow_starts / _rag),
+# so the first paint doesn't wait on the LlamaCloud SDK and friends.
+def _flow_starts():
+    """Detected intent -> (state reset that returns the opening message, meta line)."""
+    from flows.remittance_flow import reset_remittance_state
+    from flows.financial_flow import reset_financial_state
+    from flows.scam_flow import reset_scam_state
+    return {
+        "remittance": (reset_remittance_state, "Flow: Remittance"),
+        "financial": (reset_financial_state, "Flow: Financial Planning"),
+        "scam": (reset_scam_state, "Flow: Scam Safety"),
+    }
 
-# app.py (top imports)
-from flows.remittance_flow import (
-    is_remittance_intent, reset_remittance_state, handle_remittance_turn
-)
-from flows.financial_flow import (
-    is_financial_intent, reset_financial_state, handle_financial_turn
-)
-
-from flows.scam_flow import (
-    is_scam_intent, reset_scam_state, handle_scam_turn
-)
-
-from rag_backend import answer_query  # backend function
+@st.cache_resource
+def _rag():
+    from rag_backend import answer_query_stream
+    return answer_query_stream
 
+# Secrets don't change while the process runs, so copy them into os.environ once
+# (no spinner: this runs before st.set_page_config, which must be the first element)
+@st.cache_resource(show_spinner=False)
 def _apply_secrets_to_env():
     try:
         # st.secrets is a toml-like dict; flatten one level if needed
@@ -30,11 +45,78 @@ def _apply_secrets_to_env():
                     os.environ[str(kk)] = str(vv)
     except Exception:
         pass  # running locally without st.secrets
+    return True
 
 _apply_secrets_to_env()
 
+_BASENAME_RE = re.compile(r"[^/\\]+$")  # last path segment, "/" or "\\" separated
+
+def _norm_sources(srcs):
+    # basenames, deduped in order, capped at 8 – computed once when an assistant message is appended
+    names = (_BASENAME_RE.search(str(s)) for s in srcs)
+    return list(dict.fromkeys(m.group(0) for m in names if m))[:8]
+
+# Only the most recent messages stay in session memory; older ones are spilled to a per-session
+# JSONL log and only read back when the user asks to see them. The logs live in the temp dir
+# and are swept once they haven't been written for SPILL_MAX_AGE_S (Streamlit has no hook for
+# a session going away), so transcripts don't pile up on a shared deployment.
+HOT_MESSAGES = 200
+SESSIONS_DIR = os.path.join(tempfile.gettempdir(), "sg-rag-chat-sessions")
+SPILL_MAX_AGE_S = 6 * 3600
+
+def _new_messages():
+    return deque(maxlen=HOT_MESSAGES)
+
+def _spill_path():
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return os.path.join(SESSIONS_DIR, f"{st.session_state.session_id}.jsonl")
+
+def _append_message(msg):
+    msgs = st.session_state.messages
+    if len(msgs) == msgs.maxlen:
+        # the oldest message is about to be evicted: keep it in the on-disk log
+        os.makedirs(SESSIONS_DIR, exist_ok=True)
+        with open(_spill_path(), "ab") as f:
+            f.write(orjson.dumps(msgs[0]) + b"\n")
+        st.session_state.spilled = st.session_state.get("spilled", 0) + 1
+    msgs.append(msg)
+
+def _remove_spill(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Runs at most once an hour per process (the cached result expires), on whichever run comes next
+@st.cache_resource(ttl=3600, show_spinner=False)
+def _sweep_spill_logs():
+    cutoff = time.time() - SPILL_MAX_AGE_S
+    try:
+        entries = list(os.scandir(SESSIONS_DIR))
+    except FileNotFoundError:
+        return True
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                _remove_spill(entry.path)
+        except OSError:
+            pass
+    return True
+
+# Short TTL: a history is only kept in memory while the user is looking at it
+@st.cache_data(ttl=60, max_entries=4, show_spinner=False)
+def _load_history(path, count):
+    # `count` (lines spilled so far) is part of the key: the log only ever grows
+    try:
+        with open(path, "rb") as f:
+            return [orjson.loads(line) for line in f]
+    except FileNotFoundError:
+        return []  # swept after a long idle
+
 load_dotenv()
 st.set_page_config(page_title="SG RAG Chat", page_icon="🇸🇬", layout="wide")
+_sweep_spill_logs()
 
 # push content down so the toolbar doesn't overlap
 st.markdown("""
@@ -48,8 +130,15 @@ st.markdown("""
     padding-top: 4px;    /* adjust top padding */
     padding-bottom: 4px; /* adjust bottom padding */
 }
-    div[data-testid="stFormSubmitButton"] {
-    display: none !important;        
+    div[data-testid="stFormSubmitButton"] button {
+    margin-top: 15px;
+    border-radius: 12px;
+    font-weight: 600;
+    font-size: 14px;
+    background-color: #4CAF50;
+    border: none;
+    color: white;
+    width: 100%;
 }
     label[for="text_input_1"] {
     display: none;
@@ -61,75 +150,137 @@ div[data-testid="stAppIframeResizerAnchor"] {
 </style>
 """, unsafe_allow_html=True)
 
-# app.py (top) – after set_page_config and before rendering
-# Runner: if a backend call is pending, do it now (after we've already shown the loader on the previous run)
-if st.session_state.get("run_backend"):
+# Plain Q&A streams the answer on a worker thread so the script returns right away and the
+# loader bubble is painted; each rerun shows the text streamed so far and swaps in the final
+# answer when the future is done.
+@st.cache_resource
+def _pool():
+    return concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+TYPING_HTML = "<span class='dot-flashing' aria-label='typing'></span> Thinking…"
+# Replaces the loader when the backend or a flow step raises, so the turn still ends
+ERROR_TEXT = "Sorry, something went wrong while answering. Please try again."
+ERROR_META = "Error ⚠️"
+
+def _drain_answer(stream_fn, q, buf):
+    # runs on the worker thread: `buf` is a plain list shared with the script thread
+    info = {}
+    for tok in stream_fn(q, info=info):
+        buf.append(tok)
+    return {"answer": "".join(buf), **info}
+
+def _submit_query(q):
+    _append_message({"role": "assistant", "content": TYPING_HTML, "meta": "Thinking…", "sources": []})
+    st.session_state.pending_stream = buf = []
+    st.session_state.pending_future = _pool().submit(_drain_answer, _rag(), q, buf)
+
+def _busy():
+    return st.session_state.get("pending_future") is not None or bool(st.session_state.get("run_backend"))
+
+def _abort_turn():
+    st.session_state.pending_future = None
+    st.session_state.pending_stream = None
     st.session_state.run_backend = False
-
-    # Plain Q&A path
-    if st.session_state.get("pending_query"):
-        from rag_backend import answer_query
-        q = st.session_state.pending_query
-        st.session_state.pending_query = ""
-        res = answer_query(q)
+    st.session_state.flow_step_ready = False
+    st.session_state.pending_flow = None
+    error = {"role": "assistant", "content": ERROR_TEXT, "meta": ERROR_META, "sources": []}
+    if st.session_state.messages and st.session_state.messages[-1].get("role") == "assistant":
+        st.session_state.messages[-1] = error
+    else:
+        _append_message(error)
+
+def _advance_pending():
+    # Plain Q&A path: show partial text while streaming, consume the answer once it is ready
+    future = st.session_state.get("pending_future")
+    if future is not None and not future.done():
+        partial = "".join(st.session_state.get("pending_stream") or [])
+        if partial and st.session_state.messages and st.session_state.messages[-1].get("role") == "assistant":
+            st.session_state.messages[-1] = {"role": "assistant", "content": partial, "meta": "Thinking…", "sources": [], "streaming": True}
+    elif future is not None:
+        st.session_state.pending_future = None
+        st.session_state.pending_stream = None
+        try:
+            res = future.result()
+        except Exception as e:
+            print(f"[answer error] {e}")
+            res = {"answer": ERROR_TEXT, "error": True}
         ans = (res.get("answer") or "").strip()
         used_rag = bool(res.get("used_rag"))
         sources = res.get("sources") or []
-        meta = "Answer grounded in uploaded context ✅" if used_rag else "General knowledge fallback ⚠️"
+        meta = ERROR_META if res.get("error") else (
+            "Answer grounded in uploaded context ✅" if used_rag else "General knowledge fallback ⚠️"
+        )
 
         # Replace loader
         if st.session_state.messages and st.session_state.messages[-1].get("role") == "assistant":
             st.session_state.messages[-1] = {
-                "role": "assistant", "content": ans, "meta": meta, "sources": sources
+                "role": "assistant", "content": ans, "meta": meta, "sources": sources,
+                "display_sources": _norm_sources(sources)
             }
         else:
-            st.session_state.messages.append({"role": "assistant", "content": ans, "meta": meta, "sources": sources})
-
-        st.rerun()
+            _append_message({"role": "assistant", "content": ans, "meta": meta, "sources": sources, "display_sources": _norm_sources(sources)})
+
+    # Flow path: the run that schedules a step only paints the loader; the step itself runs
+    # on the next fragment tick, so the user sees "Thinking…" while it works.
+    if not st.session_state.get("run_backend"):
+        return
+    if not st.session_state.get("flow_step_ready"):
+        st.session_state.flow_step_ready = True
+        return
+    st.session_state.run_backend = False
+    st.session_state.flow_step_ready = False
 
     # Flow path (remittance / financial), run one flow step now
     flow_name = st.session_state.get("pending_flow")
     flow_input = st.session_state.get("flow_pending_input", "")
+    flow_input_low = st.session_state.get("flow_pending_input_low", "")
     if flow_name and flow_input:
         # import here to avoid circulars at import time
         from flows.remittance_flow import handle_remittance_turn
         from flows.financial_flow import handle_financial_turn
-
-        if flow_name == "remittance":
-            out = handle_remittance_turn(flow_input, st.session_state)
-        elif flow_name == "financial":
-            out = handle_financial_turn(flow_input, st.session_state)
-        elif flow_name == "scam":
-            out = handle_scam_turn(flow_input, st.session_state)
-        else:
-            out = {"text": "Okay, ending current flow. Ask me anything else.", "used_backend": False, "used_rag": False, "sources": [], "done": True}
-            st.session_state.flow = None
-            st.session_state.flow_state = None
-
-        meta = "Flow: Guidance" if not out.get("used_backend") else (
+        from flows.scam_flow import handle_scam_turn
+
+        try:
+            if flow_name == "remittance":
+                out = handle_remittance_turn(flow_input, flow_input_low, st.session_state)
+            elif flow_name == "financial":
+                out = handle_financial_turn(flow_input, flow_input_low, st.session_state)
+            elif flow_name == "scam":
+                out = handle_scam_turn(flow_input, flow_input_low, st.session_state)
+            else:
+                out = {"text": "Okay, ending current flow. Ask me anything else.", "used_backend": False, "used_rag": False, "sources": [], "done": True}
+                st.session_state.flow = None
+                st.session_state.flow_state = None
+        except Exception as e:
+            # the flow stays on its current step, so resending the answer retries it
+            print(f"[flow error] {flow_name}: {e}")
+            out = {"text": ERROR_TEXT, "error": True, "sources": [], "done": False}
+
+        meta = ERROR_META if out.get("error") else "Flow: Guidance" if not out.get("used_backend") else (
             "Answer grounded in uploaded context ✅" if out.get("used_rag") else "General knowledge fallback ⚠️"
         )
 
         # Replace loader with flow output
+        sources = out.get("sources", [])
+        reply = {"role": "assistant", "content": out.get("text",""), "meta": meta, "sources": sources, "display_sources": _norm_sources(sources)}
         if st.session_state.messages and st.session_state.messages[-1].get("role") == "assistant":
-            st.session_state.messages[-1] = {"role": "assistant", "content": out.get("text",""), "meta": meta, "sources": out.get("sources", [])}
+            st.session_state.messages[-1] = reply
         else:
-            st.session_state.messages.append({"role": "assistant", "content": out.get("text",""), "meta": meta, "sources": out.get("sources", [])})
+            _append_message(reply)
 
         # Clear pending flags
         st.session_state.pending_flow = None
         st.session_state.flow_pending_input = ""
+        st.session_state.flow_pending_input_low = ""
 
         # End flow if done
         if out.get("done"):
             st.session_state.flow = None
             st.session_state.flow_state = None
 
-        st.rerun()
-
 # No sidebar; session messages
 if "messages" not in st.session_state:
-    st.session_state.messages = []  # [{role, content, meta, sources}]
+    st.session_state.messages = _new_messages()  # deque of {role, content, meta, sources}
 
 if "flow" not in st.session_state:
     st.session_state.flow = None          # "remittance" | "financial" | None
@@ -148,43 +299,102 @@ with c1:
     )
 with c2:
     if st.button("Clear", help="Clear this conversation"):
-        st.session_state.messages = []
+        st.session_state.messages = _new_messages()
+        st.session_state.pending_future = None
+        if st.session_state.get("spilled"):
+            _remove_spill(_spill_path())
+        st.session_state.spilled = 0
+        st.session_state.show_history = False
         st.rerun()
 
 # ---------- conversation renderer ----------
+# One Markdown pipeline per process (extensions/regexes are built once); reset() clears
+# per-document state between bubbles. The lock serializes use across session threads.
+@st.cache_resource
+def _markdown():
+    return md.Markdown(extensions=["extra", "sane_lists"], output_format="html"), threading.Lock()
+
+def _render_html(role, content, meta, display_sources):
+    klass = "user" if role == "user" else "bot"
+    renderer, lock = _markdown()
+    with lock:
+        html_content = renderer.reset().convert(content)
+    bubble = f'<div class="bubble {klass}">{html_content}</div>'
+    meta_line = f'<div class="meta">{meta}</div>' if meta else ""
+    src_line = ""
+    if role == "assistant" and display_sources:
+        src_line = f'<div class="srcs">Sources: {", ".join(display_sources)}</div>'
+    return bubble + meta_line + src_line
+
+# Messages don't change once appended, so each bubble is rendered (markdown included) once
+# and served from the cache on later reruns; only newly appended messages are parsed.
+# The in-flight bubble changes on every tick, so it bypasses the cache instead of filling it.
+_render_one = st.cache_data(max_entries=4096, show_spinner=False)(_render_html)
+
+def _render_msg(m):
+    render = _render_html if m.get("streaming") else _render_one
+    return render(m.get("role"), m.get("content", ""), m.get("meta", ""), tuple(m.get("display_sources", [])))
+
+# Only the newest bubbles go into the DOM; older ones are shipped as a JSON buffer and
+# hydrated by templates/chat.html when their placeholder scrolls into view.
+DOM_WINDOW = 50
+
 def render_messages_html(messages):
+    head, tail = messages[:-DOM_WINDOW], messages[-DOM_WINDOW:]
     html_parts = []
-    for m in messages:
-        role = m.get("role")
-        content = m.get("content", "")
-        meta = m.get("meta", "")
-        sources = m.get("sources", [])
-        klass = "user" if role == "user" else "bot"
-        html_content = md.markdown(content, extensions=["extra", "sane_lists"])
-        bubble = f'<div class="bubble {klass}">{html_content}</div>'
-        meta_line = f'<div class="meta">{meta}</div>' if meta else ""
-        src_line = ""
-        if role == "assistant" and sources:
-            uniq = []
-            for s in sources:
-                name = str(s).split("/")[-1].split("\\")[-1]
-                if name not in uniq:
-                    uniq.append(name)
-            src_line = f'<div class="srcs">Sources: {", ".join(uniq[:8])}</div>'
-        html_parts.append(bubble + meta_line + src_line)
+    if head:
+        history = [_render_msg(m) for m in head]
+        html_parts.extend(
+            f'<div class="bubble-placeholder" data-idx="{i}" style="height:60px"></div>'
+            for i in range(len(history))
+        )
+        # "</" is escaped so a message can't close the <script> tag early
+        history_json = orjson.dumps(history).decode().replace("</", "<\\/")
+        html_parts.append(f'<script type="application/json" id="msgs">{history_json}</script>')
+    html_parts.extend(_render_msg(m) for m in tail)
     return "\n".join(html_parts)
 
-# Load template
+# Load template (read once per process; restart the app to pick up edits), pre-split
+# around the messages marker so each render is a plain concatenation
+@st.cache_resource
+def _load_template(path):
+    with open(path, "r", encoding="utf-8") as f:
+        prefix, suffix = f.read().split("{{MESSAGES_HTML}}", 1)
+    return prefix, suffix
+
 template_path = os.path.join("templates", "chat.html")
-with open(template_path, "r", encoding="utf-8") as f:
-    template_html = f.read()
+template_prefix, template_suffix = _load_template(template_path)
 
-# Build conversation HTML
-messages_html = render_messages_html(st.session_state.messages)
-final_html = template_html.replace("{{MESSAGES_HTML}}", messages_html)
+# Conversation fragment: while a turn is in flight it re-runs on its own every 0.3s to stream
+# text / run the pending flow step, without re-executing the header, buttons and form.
+def _conversation():
+    was_busy = _busy()
+    try:
+        _advance_pending()
+    except Exception as e:
+        # Send and the quick actions are disabled while busy: whatever went wrong, the turn must
+        # end here (flags cleared, error bubble) so the rerun below unlocks them
+        print(f"[turn error] {e}")
+        _abort_turn()
+    if was_busy and not _busy():
+        st.rerun()  # turn finished: one full rerun so polling stops and the controls re-enable
+
+    # Build conversation HTML (spilled history only when the user asked for it)
+    messages = list(st.session_state.messages)
+    if st.session_state.get("show_history") and st.session_state.get("spilled"):
+        messages = _load_history(_spill_path(), st.session_state.spilled) + messages
+    messages_html = render_messages_html(messages)
+    final_html = template_prefix + messages_html + template_suffix
+
+    # Show conversation
+    components.html(final_html, height=500, scrolling=True)
+
+if st.session_state.get("spilled") and not st.session_state.get("show_history"):
+    if st.button(f"Show {st.session_state.spilled} earlier messages", key="show_history_btn"):
+        st.session_state.show_history = True
+        st.rerun()
 
-# Show conversation
-components.html(final_html, height=500, scrolling=True)
+st.fragment(run_every=0.3 if _busy() else None)(_conversation)()
 
 # ---------- INPUT AT THE BOTTOM (Form = Enter submits) ----------
 # ---------- QUICK ACTION BUTTONS ----------
@@ -216,177 +426,80 @@ cols = st.columns([0.1, 0.12, 0.12,0.7])  # last column is empty for spacing
 
 for i, (label, msg) in enumerate(quick_actions):
     with cols[i]:
-        if st.button(label, key=f"btn_{label}"):
+        if st.button(label, key=f"btn_{label}", disabled=_busy()):
             # Append user message
-            st.session_state.messages.append({"role": "user", "content": msg, "meta": "", "sources": []})
+            _append_message({"role": "user", "content": msg, "meta": "", "sources": []})
 
             # Reuse your existing flow detection logic
-            from flows.remittance_flow import is_remittance_intent, reset_remittance_state
-            from flows.financial_flow import is_financial_intent, reset_financial_state
-            from flows.scam_flow import is_scam_intent, reset_scam_state
-
-            if is_remittance_intent(msg):
-                first_msg = reset_remittance_state(st.session_state)
-                st.session_state.messages.append({"role": "assistant", "content": first_msg, "meta": "Flow: Remittance", "sources": []})
-                st.rerun()
-            elif is_financial_intent(msg):
-                first_msg = reset_financial_state(st.session_state)
-                st.session_state.messages.append({"role": "assistant", "content": first_msg, "meta": "Flow: Financial Planning", "sources": []})
-                st.rerun()
-            elif is_scam_intent(msg):
-                first_msg = reset_scam_state(st.session_state)
-                st.session_state.messages.append({"role": "assistant", "content": first_msg, "meta": "Flow: Scam Safety", "sources": []})
+            from flows.intent import detect_intent
+
+            intent = detect_intent(msg.lower())
+            flow_starts = _flow_starts()
+            if intent in flow_starts:
+                reset_fn, flow_meta = flow_starts[intent]
+                first_msg = reset_fn(st.session_state)
+                _append_message({"role": "assistant", "content": first_msg, "meta": flow_meta, "sources": []})
                 st.rerun()
             else:
                 # Fallback to normal backend Q&A
-                st.session_state.pending_query = msg
-                st.session_state.run_backend = True
+                _submit_query(msg)
                 st.rerun()
 
 
 # --- FORM SUBMIT (bottom) ---
-import streamlit as st
-import streamlit.components.v1 as components
-
-col_input, col_button = st.columns([9, 1])
-
-with col_input:
-    with st.form("chat_form", clear_on_submit=True):
+# Every real click bumps submit_seq (callbacks run once per click, before the script);
+# the handler below only acts on a sequence number it hasn't handled yet.
+def _count_submit():
+    st.session_state.submit_seq = st.session_state.get("submit_seq", 0) + 1
+
+with st.form("chat_form", clear_on_submit=True):
+    col_input, col_button = st.columns([9, 1])
+    with col_input:
         user_input = st.text_input(
             "", 
             key="chatbox",
             placeholder="Ask Anything..."
         )
-        # Hidden submit
-        submitted = st.form_submit_button("Send", type="primary", key="hidden_submit")
-
-with col_button:
-    components.html("""
-    <div style="height:100%; display:flex; align-items:center;">
-        <button id="customSend" style="
-            padding: 8px 16px; 
-            margin-top:15px;
-            border-radius: 12px; 
-            font-weight: 600;
-            font-size: 14px;
-            background-color: #4CAF50;
-            color: white;
-            border: none;
-            cursor: pointer;
-            width: 100%;
-        ">Send</button>
-    </div>
-
-    <script>
-    setTimeout(() => {
-        const hiddenSubmit = window.parent.document.querySelector('div[data-testid="stFormSubmitButton"] button');
-        const customButton = document.getElementById("customSend");
-
-        customButton.onclick = () => {
-            if(hiddenSubmit){
-                hiddenSubmit.click();  // trigger the hidden Streamlit submit button
-            }
-        }
-    }, 500);  // wait a bit to ensure the button exists
-    </script>
-    """, height=100)
-
-if submitted and user_input.strip():
+    with col_button:
+        # Native submit, styled as the green pill in the <style> block above
+        # Disabled while a turn is in flight: a second submit would replace the pending answer (or
+        # have it land on the wrong bubble); the full rerun at the end of the turn re-enables it
+        submitted = st.form_submit_button("Send", type="primary", key="send_submit", on_click=_count_submit, disabled=_busy())
+
+if submitted and _busy():
+    st.toast("Please wait for the current answer to finish.")  # e.g. Enter pressed mid-turn
+elif submitted and user_input.strip() and st.session_state.get("handled_submit_id") != st.session_state.get("submit_seq"):
+    st.session_state.handled_submit_id = st.session_state.get("submit_seq")
     ui_q = user_input.strip()
+    ui_q_norm = ui_q.lower()  # lowercased once; intent detection and flow steps reuse it
 
     # 1) Show user message immediately
-    st.session_state.messages.append({"role": "user", "content": ui_q, "meta": "", "sources": []})
+    _append_message({"role": "user", "content": ui_q, "meta": "", "sources": []})
 
     # 2) FLOW ROUTING comes BEFORE any backend scheduling
-    from flows.remittance_flow import is_remittance_intent, reset_remittance_state
-    from flows.financial_flow import is_financial_intent, reset_financial_state
+    from flows.intent import detect_intent
 
     # If there is no active flow, try to start one
     if not st.session_state.get("flow"):
-        if is_remittance_intent(ui_q):
-            first_msg = reset_remittance_state(st.session_state)
-            st.session_state.messages.append({"role": "assistant", "content": first_msg, "meta": "Flow: Remittance", "sources": []})
-            st.rerun()
-
-        elif is_financial_intent(ui_q):
-            first_msg = reset_financial_state(st.session_state)
-            st.session_state.messages.append({"role": "assistant", "content": first_msg, "meta": "Flow: Financial Planning", "sources": []})
-            st.rerun()
-
-        elif is_scam_intent(ui_q):  
-            first_msg = reset_scam_state(st.session_state)
-            st.session_state.messages.append({"role": "assistant", "content": first_msg, "meta": "Flow: Scam Safety", "sources": []})
+        intent = detect_intent(ui_q_norm)
+        flow_starts = _flow_starts()
+        if intent in flow_starts:
+            reset_fn, flow_meta = flow_starts[intent]
+            first_msg = reset_fn(st.session_state)
+            _append_message({"role": "assistant", "content": first_msg, "meta": flow_meta, "sources": []})
             st.rerun()
 
         # No flow matched → plain Q&A with loader
         else:
-            typing_html = "<span class='dot-flashing' aria-label='typing'></span> Thinking…"
-            st.session_state.messages.append({"role": "assistant", "content": typing_html, "meta": "Thinking…", "sources": []})
-            st.session_state.pending_query = ui_q
-            st.session_state.run_backend = True
+            _submit_query(ui_q)
             st.rerun()
 
     # 3) A flow IS active → schedule the flow step with a loader
     else:
-        typing_html = "<span class='dot-flashing' aria-label='typing'></span> Thinking…"
-        st.session_state.messages.append({"role": "assistant", "content": typing_html, "meta": "Thinking…", "sources": []})
+        _append_message({"role": "assistant", "content": TYPING_HTML, "meta": "Thinking…", "sources": []})
         st.session_state.pending_flow = st.session_state.flow
         st.session_state.flow_pending_input = ui_q
+        st.session_state.flow_pending_input_low = ui_q_norm
         st.session_state.run_backend = True
+        st.session_state.flow_step_ready = False
         st.rerun()
-
-
-
-if submitted and user_input.strip():
-    ui_q = user_input.strip()
-    # 1) Append user message
-    st.session_state.messages.append({"role": "user", "content": ui_q, "meta": "", "sources": []})
-
-    # 2) If no active flow, detect & start one; else route to active flow
-    if not st.session_state.flow:
-        if is_remittance_intent(ui_q):
-            # start remittance flow
-            first_msg = reset_remittance_state(st.session_state)
-            st.session_state.messages.append({"role": "assistant", "content": first_msg, "meta": "Flow: Remittance", "sources": []})
-            st.rerun()
-
-        elif is_financial_intent(ui_q):
-            # start financial flow
-            first_msg = reset_financial_state(st.session_state)
-            st.session_state.messages.append({"role": "assistant", "content": first_msg, "meta": "Flow: Financial Planning", "sources": []})
-            st.rerun()
-
-        else:
-            # no flow detected => fallback to your normal backend Q&A
-            from rag_backend import answer_query
-            res = answer_query(ui_q)
-            ans = (res.get("answer") or "").strip()
-            used_rag = bool(res.get("used_rag"))
-            sources = res.get("sources") or []
-            meta = "Answer grounded in uploaded context ✅" if used_rag else "General knowledge fallback ⚠️"
-            st.session_state.messages.append({"role": "assistant", "content": ans, "meta": meta, "sources": sources})
-            st.rerun()
-
-    else:
-        # Active flow
-        if st.session_state.flow == "remittance":
-            out = handle_remittance_turn(ui_q, st.session_state)
-        elif st.session_state.flow == "financial":
-            out = handle_financial_turn(ui_q, st.session_state)
-        else:
-            out = {"text": "Okay, ending current flow. Ask me anything else.", "used_backend": False, "used_rag": False, "sources": [], "done": True}
-            st.session_state.flow = None
-
-        meta = "Flow: Guidance" if not out.get("used_backend") else (
-            "Answer grounded in uploaded context ✅" if out.get("used_rag") else "General knowledge fallback ⚠️"
-        )
-        st.session_state.messages.append({"role": "assistant", "content": out.get("text",""), "meta": meta, "sources": out.get("sources", [])})
-
-        # If flow done, clear it
-        if out.get("done"):
-            st.session_state.flow = None
-            st.session_state.flow_state = None
-
-        st.rerun()
-
-
@@ -0,0 +1,23 @@
+# flows/__init__.py
+from functools import wraps
+from typing import Any, Callable, Dict
+
+
+def replay_duplicate_turn(handler: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    """
+    Wrap a handle_*_turn(user_text, user_low, state) so resending text that only got a re-prompt
+    (the step left flow_state unchanged) gets that reply back instead of re-running the step.
+    Any state transition clears the stored turn: the same text is then a new answer to the next
+    question (e.g. "skip" twice in a row) and must reach the handler.
+    The reset_*_state functions clear the stored turn when a flow (re)starts.
+    """
+    @wraps(handler)
+    def wrapper(user_text: str, user_low: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        before = state.get("flow_state")
+        last = state.get("_last_turn")
+        if last and last[0] == before and last[1] == user_text:
+            return last[2]
+        out = handler(user_text, user_low, state)
+        state["_last_turn"] = (before, user_text, out) if state.get("flow_state") == before else None
+        return out
+    return wrapper
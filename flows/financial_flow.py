@@ -1,6 +1,9 @@
 # flows/financial_flow.py
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
+import streamlit as st
+from flows import replay_duplicate_turn
 from rag_backend import answer_query
 
 """
@@ -18,6 +21,13 @@ FIN_INTENT_PATTERNS = [
     r"\b(budget|budgeting|save|savings|financial plan|planning|invest|investment)\b",
     r"\b(expense|expenses|spend|spending|emergency fund)\b",
 ]
+# one alternation, so the text is scanned once rather than once per pattern
+_FIN_RE = re.compile("|".join(f"(?:{p})" for p in FIN_INTENT_PATTERNS))  # run on lowercased text
+# first number in the reply; thousands separators are allowed inside it and stripped from the match
+_AMOUNT_RE = re.compile(r"\d[\d,]*(?:\.\d+)?", re.ASCII)
+# Substrings at least one of which every pattern match contains; checked on the lowercased
+# text before any regex runs, so most messages are rejected without touching the engine
+FIN_HOT_WORDS = ("budget", "save", "saving", "invest", "financial", "plan", "expense", "spend", "emergency")
 
 ASK_GOAL     = "ask_goal"
 ASK_HORIZ    = "ask_horizon"
@@ -51,11 +61,19 @@ _PLAN_KEYS = (
     "migrant worker", "handy guide"
 )
 
-def is_financial_intent(text: str) -> bool:
+# Built once: hashable (usable as an st.cache_data key) and reused on every tips turn
+_DOC_KEYS_FS = frozenset(_DOC_KEYS)
+_PLAN_KEYS_FS = frozenset(_PLAN_KEYS)
+_COMBINED_FS = _DOC_KEYS_FS | _PLAN_KEYS_FS
+
+def is_financial_intent(text: str, low: str | None = None) -> bool:
     if not text:
         return False
-    low = text.lower()
-    return any(re.search(p, low) for p in FIN_INTENT_PATTERNS)
+    if low is None:  # callers that already lowercased the turn's text pass it in
+        low = text.lower()
+    if not any(w in low for w in FIN_HOT_WORDS):
+        return False
+    return _FIN_RE.search(low) is not None
 
 def reset_financial_state(state: Dict[str, Any]) -> str:
     state["flow"] = "financial"
@@ -63,14 +81,57 @@ def reset_financial_state(state: Dict[str, Any]) -> str:
     state["goal"] = None
     state["horizon"] = None
     state["income"] = None
+    state["_last_turn"] = None
     return (
         "Let’s plan your money 📈\n"
         "What’s your main **goal**? (e.g., save for family, emergency fund, pay debt)"
     )
 
-def handle_financial_turn(user_text: str, state: Dict[str, Any]) -> Dict[str, Any]:
+# The tips prompt only depends on (goal, horizon, income bucket), which many users share,
+# so answers are cached across sessions. The key is the whitespace/case-normalized prompt;
+# `_q` (leading underscore) is left out of st.cache_data's hash and is what gets sent.
+# Fallback answers are passed out as an exception, which st.cache_data doesn't store, so a
+# retrieval hiccup isn't served for the next hour.
+class _Uncached(Exception):
+    def __init__(self, res: Dict[str, Any]):
+        super().__init__()
+        self.res = res
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _cached_answer(q_key: str, keys: frozenset, _q: str) -> Dict[str, Any]:
+    res = answer_query(_q, require_keywords=keys)
+    if not res.get("used_rag"):
+        raise _Uncached(res)
+    return res
+
+def _answer(q: str, keys: frozenset) -> Dict[str, Any]:
+    try:
+        return _cached_answer(" ".join(q.split()).lower(), keys, q)
+    except _Uncached as e:
+        return e.res
+
+def _income_bucket(income: str) -> int:
+    # nearest SGD 500 (at least 500) – enough for tailoring and raises the cache hit rate
+    return max(1, round(float(income) / 500)) * 500
+
+def _tips_query(state: Dict[str, Any]) -> str:
+    income_part = f" Monthly income: about SGD {_income_bucket(state['income'])}." if state.get("income") else ""
+    return (
+        "Financial planning tips tailored for a migrant worker in Singapore."
+        f" Goal: {state.get('goal')}. Time horizon: {state.get('horizon')}.{income_part} "
+        "Keep it practical and simple: budgeting % split (needs/remittance/savings), "
+        "small emergency fund, **remittance fee/FX basics**, and **how PayLah/PayNow can help for day-to-day**. "
+        "If available, ground guidance using 'mw handy guide english', 'your guide to paylah', "
+        "'transfer funds using dbs paylah', and 'financial institution directory'."
+    )
+
+@replay_duplicate_turn
+def handle_financial_turn(user_text: str, user_low: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    # `user_text` is the stripped input, `user_low` its lowercase form (normalized once by the caller)
     cur = state.get("flow_state", ASK_GOAL)
-    user = (user_text or "").strip()
+    user = user_text or ""
+    low = user_low or ""
+    tips_res = None
 
     if cur == ASK_GOAL:
         if not user:
@@ -87,10 +148,10 @@ def handle_financial_turn(user_text: str, state: Dict[str, Any]) -> Dict[str, An
         return {"text": "Optional: What’s your **monthly income** in SGD? (e.g., 900) You can also reply **skip**.", "used_backend": False, "used_rag": False, "sources": [], "done": False}
 
     if cur == ASK_INCOME:
-        if user and user.lower() != "skip":
-            nums = re.findall(r"\d+(?:\.\d+)?", user.replace(",", ""))
-            if nums:
-                state["income"] = nums[0]
+        if low and low != "skip":
+            m = _AMOUNT_RE.search(user)
+            if m:
+                state["income"] = m.group(0).replace(",", "")
         # Before tips, offer a targeted bank-setup path to ground on account-opening docs.
         state["flow_state"] = ASK_BANKPATH
         return {
@@ -102,7 +163,7 @@ def handle_financial_turn(user_text: str, state: Dict[str, Any]) -> Dict[str, An
         }
 
     if cur == ASK_BANKPATH:
-        if user.lower() in ("yes", "y", "yeah", "ok", "okay", "sure"):
+        if low in ("yes", "y", "yeah", "ok", "okay", "sure"):
             # Explicitly craft a query that names your corpus cues so retrieval prefers those docs.
             q = (
                 "Step-by-step **bank account setup** in Singapore for a migrant worker. "
@@ -113,7 +174,12 @@ def handle_financial_turn(user_text: str, state: Dict[str, Any]) -> Dict[str, An
                 "'posb payroll account for work permit holders in singapore', "
                 "'financial institution directory', and 'mw handy guide english' if available."
             )
-            res = answer_query(q, require_keywords=_DOC_KEYS)
+            # The tips are needed in this same turn, so run both RAG queries concurrently.
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                res, tips_res = pool.map(
+                    _answer,
+                    (q, _tips_query(state)), (_DOC_KEYS_FS, _COMBINED_FS)
+                )
             # After bank path, still give planning tips next
             state["bank_path_answer"] = res.get("answer", "")
             state["bank_path_sources"] = res.get("sources", [])
@@ -121,16 +187,7 @@ def handle_financial_turn(user_text: str, state: Dict[str, Any]) -> Dict[str, An
         state["flow_state"] = SHOW_TIPS
 
     if state.get("flow_state") == SHOW_TIPS:
-        income_part = f" Monthly income: SGD {state.get('income')}." if state.get("income") else ""
-        q = (
-            "Financial planning tips tailored for a migrant worker in Singapore."
-            f" Goal: {state.get('goal')}. Time horizon: {state.get('horizon')}.{income_part} "
-            "Keep it practical and simple: budgeting % split (needs/remittance/savings), "
-            "small emergency fund, **remittance fee/FX basics**, and **how PayLah/PayNow can help for day-to-day**. "
-            "If available, ground guidance using 'mw handy guide english', 'your guide to paylah', "
-            "'transfer funds using dbs paylah', and 'financial institution directory'."
-        )
-        res = answer_query(q, require_keywords=_PLAN_KEYS + _DOC_KEYS)
+        res = tips_res or _answer(_tips_query(state), _COMBINED_FS)
 
         # Stitch bank-path answer (if any) before tips
         bank_block = ""
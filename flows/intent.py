@@ -0,0 +1,56 @@
+# flows/intent.py
+import re
+
+import ahocorasick
+
+from flows.remittance_flow import REMITTANCE_INTENT_PATTERNS, REMITTANCE_HOT_WORDS
+from flows.financial_flow import FIN_INTENT_PATTERNS, FIN_HOT_WORDS
+from flows.scam_flow import SCAM_INTENT_PATTERNS, SCAM_HOT_WORDS
+
+"""
+Single-pass intent detection across all flows:
+- Every flow's intent patterns are fused into one alternation with a named group per flow,
+  so the user's text is scanned once instead of once per pattern per flow.
+- Group names are the flow names used in session state ("remittance", "financial", "scam").
+- When several flows match, the order below decides (same precedence the app always used).
+- Before the regex runs, the lowercased text is checked for any flow's hot words (plain
+  substrings that every pattern match contains); most chit-chat never reaches the regex.
+- The regex is case-sensitive and runs on the lowercased text, like the per-flow checks always
+  did: the uppercase literals in the scam patterns (OTP, MOM|ICA) never match, so e.g. "How do
+  I get an OTP for Singpass?" stays plain Q&A.
+"""
+
+_INTENT_ORDER = ("remittance", "financial", "scam")
+
+_INTENT_PATTERNS = {
+    "remittance": REMITTANCE_INTENT_PATTERNS,
+    "financial": FIN_INTENT_PATTERNS,
+    "scam": SCAM_INTENT_PATTERNS,
+}
+
+_INTENT_RX = re.compile(
+    "|".join(
+        f"(?P<{name}>{'|'.join(f'(?:{p})' for p in _INTENT_PATTERNS[name])})"
+        for name in _INTENT_ORDER
+    )
+)
+
+# All flows' hot words (~35 literals) in one automaton: the miss case is a single C-level pass
+# over the text instead of one substring scan per word
+_INTENT_HOT_AC = ahocorasick.Automaton()
+for _w in dict.fromkeys(REMITTANCE_HOT_WORDS + FIN_HOT_WORDS + SCAM_HOT_WORDS):
+    _INTENT_HOT_AC.add_word(_w, _w)
+_INTENT_HOT_AC.make_automaton()
+
+def detect_intent(low: str) -> str | None:
+    """Return the flow name whose intent matches `low` (the already-lowercased text), or None."""
+    if not low:
+        return None
+    if next(_INTENT_HOT_AC.iter(low), None) is None:
+        return None
+    found = set()
+    for m in _INTENT_RX.finditer(low):
+        if m.lastgroup == _INTENT_ORDER[0]:
+            return m.lastgroup
+        found.add(m.lastgroup)
+    return next((name for name in _INTENT_ORDER if name in found), None)
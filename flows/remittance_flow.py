@@ -1,7 +1,9 @@
 # flows/remittance_flow.py
 import re
 from typing import Dict, Any
-from rag_backend import answer_query
+import ahocorasick
+from flows import replay_duplicate_turn
+from rag_backend import answer_query, answer_queries
 
 """
 Remittance flow aligned to your corpus:
@@ -18,6 +20,10 @@ REMITTANCE_INTENT_PATTERNS = [
     r"\b(remit|remittance|send money|transfer (money|funds)?)\b",
     r"\b(remesa|remitir)\b",
 ]
+_REM_RE = re.compile("|".join(f"(?:{p})" for p in REMITTANCE_INTENT_PATTERNS))  # run on lowercased text
+_AMOUNT_RE = re.compile(r"\d[\d,]*(?:\.\d+)?", re.ASCII)  # commas stripped from the match
+# Cheap substring prefilter: every pattern match contains one of these (lowercased)
+REMITTANCE_HOT_WORDS = ("remit", "remesa", "send money", "transfer")
 
 ASK_COUNTRY   = "ask_country"
 ASK_METHOD    = "ask_method"
@@ -39,6 +45,13 @@ METHOD_MAP = {
     "paynow": "PayNow",
 }
 
+# All METHOD_MAP keys in one automaton: a single pass over the text finds every key.
+# Payloads carry the key's position in METHOD_MAP so the earliest key still wins.
+_METHOD_AC = ahocorasick.Automaton()
+for _i, (_k, _v) in enumerate(METHOD_MAP.items()):
+    _METHOD_AC.add_word(_k, (_i, _v))
+_METHOD_AC.make_automaton()
+
 # Doc/title cues + topic anchors to drive RAG selection
 _DOC_KEYS = (
     "eremittance guide to sending money home safely",
@@ -54,12 +67,16 @@ _DOC_KEYS = (
     "kyc", "required documents", "account opening", "work permit", "s pass", "employment pass",
     "fees", "charges", "exchange rate", "fx", "limits", "cash pickup", "bank transfer", "mobile wallet"
 )
+_DOC_KEYS_FS = frozenset(_DOC_KEYS)  # built once; answer_query keys its cache on a frozenset
 
-def is_remittance_intent(text: str) -> bool:
+def is_remittance_intent(text: str, low: str | None = None) -> bool:
     if not text:
         return False
-    low = text.lower()
-    return any(re.search(pat, low) for pat in REMITTANCE_INTENT_PATTERNS)
+    if low is None:  # callers that already lowercased the turn's text pass it in
+        low = text.lower()
+    if not any(w in low for w in REMITTANCE_HOT_WORDS):
+        return False
+    return _REM_RE.search(low) is not None
 
 def reset_remittance_state(state: Dict[str, Any]) -> str:
     state["flow"] = "remittance"
@@ -67,113 +84,136 @@ def reset_remittance_state(state: Dict[str, Any]) -> str:
     state["country"] = None
     state["method"] = None
     state["amount"] = None
+    state["budget_tips"] = None
+    state["_last_turn"] = None
     return (
         "Let’s sort out **remittance** ✨\n"
         "Which **country** do you usually send money to?"
     )
 
-def _normalize_method(text: str) -> str | None:
-    low = (text or "").lower().strip()
-    for key, val in METHOD_MAP.items():
-        if key in low:
-            return val
-    return None
+def _normalize_method(low: str) -> str | None:
+    best = min((hit for _, hit in _METHOD_AC.iter(low)), default=None)
+    return best[1] if best else None
+
+# Prompt templates: constant text built once, only the slots are formatted per turn.
+# Explicit doc-title cues in the query text help the retriever match metadata/content.
+_REM_QUERY_TMPL = (
+    "Remittance guidance{focus}. Cover: step-by-step sending process, **required documents/KYC**, "
+    "expected **fees/FX considerations**, **transfer times/limits**, and safety tips for migrants. "
+    "Refer to uploaded materials such as 'eremittance guide to sending money home safely', "
+    "'your guide to paylah', 'transfer funds using dbs paylah', 'financial institution directory', "
+    "'documents required for account opening', 'posb payroll account for work permit holders in singapore', "
+    "and 'mw handy guide english' where relevant."
+)
 
-def handle_remittance_turn(user_text: str, state: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Returns dict: { text, used_backend, used_rag, sources, done }
-    """
-    cur = state.get("flow_state", ASK_COUNTRY)
-    user = (user_text or "").strip()
-
-    if cur == ASK_COUNTRY:
-        if not user:
-            return {"text": "Which **country** do you usually send money to?", "used_backend": False, "used_rag": False, "sources": [], "done": False}
-        state["country"] = user.title()
-        state["flow_state"] = ASK_METHOD
-        return {
-            "text": f"Got it — **{state['country']}**. Do you prefer **bank transfer**, **cash pickup**, **mobile wallet**, **PayLah**, or **PayNow**?",
-            "used_backend": False, "used_rag": False, "sources": [], "done": False
-        }
-
-    if cur == ASK_METHOD:
-        method = _normalize_method(user)
-        if not method:
-            return {
-                "text": "Please choose one: **bank transfer**, **cash pickup**, **mobile wallet**, **PayLah**, or **PayNow**.",
-                "used_backend": False, "used_rag": False, "sources": [], "done": False
-            }
-        state["method"] = method
-        state["flow_state"] = ASK_AMOUNT
+_BUDGET_QUERY_TMPL = (
+    "Budgeting tips for migrant workers in Singapore who remit monthly to {ctry}. "
+    "Be practical and simple: a % split for needs/remittance/savings, small emergency fund, "
+    "remittance fee timing/FX basics, and caution against scams. "
+    "If available, ground guidance using 'mw handy guide english', 'financial institution directory', "
+    "and PayLah/PayNow guides."
+)
+
+def _budget_query(ctry: str) -> str:
+    return _BUDGET_QUERY_TMPL.format(ctry=ctry)
+
+# FSM steps: each takes (user, low, state) and returns (reply or None, next flow_state).
+# A None reply means the step only recorded input, so the next state's step runs in the same turn.
+def _step_country(user: str, low: str, state: Dict[str, Any]):
+    if not user:
+        return {"text": "Which **country** do you usually send money to?", "used_backend": False, "used_rag": False, "sources": [], "done": False}, ASK_COUNTRY
+    state["country"] = user.title()
+    return {
+        "text": f"Got it — **{state['country']}**. Do you prefer **bank transfer**, **cash pickup**, **mobile wallet**, **PayLah**, or **PayNow**?",
+        "used_backend": False, "used_rag": False, "sources": [], "done": False
+    }, ASK_METHOD
+
+def _step_method(user: str, low: str, state: Dict[str, Any]):
+    method = _normalize_method(low)
+    if not method:
         return {
-            "text": f"Okay — **{method}**. (Optional) About how much do you usually send **per month**? You can reply with an amount like `200` or say **skip**.",
+            "text": "Please choose one: **bank transfer**, **cash pickup**, **mobile wallet**, **PayLah**, or **PayNow**.",
             "used_backend": False, "used_rag": False, "sources": [], "done": False
-        }
-
-    if cur == ASK_AMOUNT:
-        if user and user.lower() != "skip":
-            nums = re.findall(r"\d+(?:\.\d+)?", user.replace(",", ""))
-            if nums:
-                state["amount"] = nums[0]
-        state["flow_state"] = SHOW_OPTIONS
-
-    if state.get("flow_state") == SHOW_OPTIONS:
-        ctry = state.get("country") or "the destination country"
-        meth = state.get("method") or "a suitable method"
-        amt  = state.get("amount")
-
-        focus = f" from Singapore to {ctry} via {meth}"
-        if amt:
-            focus += f" for about SGD {amt} per month"
-
-        # Include explicit doc-title cues in the query text to help the retriever match metadata/content.
-        query = (
-            "Remittance guidance" + focus +
-            ". Cover: step-by-step sending process, **required documents/KYC**, expected **fees/FX considerations**, "
-            "**transfer times/limits**, and safety tips for migrants. "
-            "Refer to uploaded materials such as 'eremittance guide to sending money home safely', "
-            "'your guide to paylah', 'transfer funds using dbs paylah', 'financial institution directory', "
-            "'documents required for account opening', 'posb payroll account for work permit holders in singapore', "
-            "and 'mw handy guide english' where relevant."
-        )
-        res = answer_query(query, require_keywords=_DOC_KEYS)
+        }, ASK_METHOD
+    state["method"] = method
+    return {
+        "text": f"Okay — **{method}**. (Optional) About how much do you usually send **per month**? You can reply with an amount like `200` or say **skip**.",
+        "used_backend": False, "used_rag": False, "sources": [], "done": False
+    }, ASK_AMOUNT
+
+def _step_amount(user: str, low: str, state: Dict[str, Any]):
+    if low and low != "skip":
+        m = _AMOUNT_RE.search(user)
+        if m:
+            state["amount"] = m.group(0).replace(",", "")
+    return None, SHOW_OPTIONS
+
+def _step_options(user: str, low: str, state: Dict[str, Any]):
+    ctry = state.get("country") or "the destination country"
+    meth = state.get("method") or "a suitable method"
+    amt  = state.get("amount")
+
+    focus = f" from Singapore to {ctry} via {meth}"
+    if amt:
+        focus += f" for about SGD {amt} per month"
+
+    query = _REM_QUERY_TMPL.format(focus=focus)
+    # The budgeting tips offered next are fetched in the same batch, so a "yes" is answered
+    # without another retrieval + LLM round-trip.
+    res, state["budget_tips"] = answer_queries(
+        [query, _budget_query(state.get("country") or "home country")], require_keywords=_DOC_KEYS_FS
+    )
 
-        state["flow_state"] = OFFER_BUDGET
-        text = (
-            f"Here’s what to expect when sending money to **{ctry}** via **{meth}**:"
-            f"\n\n{res.get('answer','')}\n\n"
-            "Would you also like **simple budgeting tips** to help plan your remittances each month? (yes/no)"
+    text = (
+        f"Here’s what to expect when sending money to **{ctry}** via **{meth}**:"
+        f"\n\n{res.get('answer','')}\n\n"
+        "Would you also like **simple budgeting tips** to help plan your remittances each month? (yes/no)"
+    )
+    return {
+        "text": text,
+        "used_backend": True, "used_rag": bool(res.get("used_rag")), "sources": res.get("sources", []),
+        "done": False
+    }, OFFER_BUDGET
+
+def _step_budget(user: str, low: str, state: Dict[str, Any]):
+    if low in ("yes", "y", "yeah", "ok", "okay", "sure"):
+        res = state.get("budget_tips") or answer_query(
+            _budget_query(state.get("country") or "home country"), require_keywords=_DOC_KEYS_FS
         )
         return {
-            "text": text,
-            "used_backend": True, "used_rag": bool(res.get("used_rag")), "sources": res.get("sources", []),
-            "done": False
-        }
-
-    if state.get("flow_state") == OFFER_BUDGET:
-        if user.lower() in ("yes", "y", "yeah", "ok", "okay", "sure"):
-            ctry = state.get("country") or "home country"
-            q = (
-                f"Budgeting tips for migrant workers in Singapore who remit monthly to {ctry}. "
-                "Be practical and simple: a % split for needs/remittance/savings, small emergency fund, "
-                "remittance fee timing/FX basics, and caution against scams. "
-                "If available, ground guidance using 'mw handy guide english', 'financial institution directory', "
-                "and PayLah/PayNow guides."
-            )
-            res = answer_query(q, require_keywords=_DOC_KEYS)
-            state["flow_state"] = DONE
-            state["flow"] = None
-            return {
-                "text": f"Great — here are some budgeting tips:\n\n{res.get('answer','')}\n\nYou can ask another question anytime.",
-                "used_backend": True, "used_rag": bool(res.get("used_rag")), "sources": res.get("sources", []), "done": True
-            }
-        else:
-            state["flow_state"] = DONE
-            state["flow"] = None
-            return {
-                "text": "No worries. You can ask another question anytime.",
-                "used_backend": False, "used_rag": False, "sources": [], "done": True
-            }
+            "text": f"Great — here are some budgeting tips:\n\n{res.get('answer','')}\n\nYou can ask another question anytime.",
+            "used_backend": True, "used_rag": bool(res.get("used_rag")), "sources": res.get("sources", []), "done": True
+        }, DONE
+    return {
+        "text": "No worries. You can ask another question anytime.",
+        "used_backend": False, "used_rag": False, "sources": [], "done": True
+    }, DONE
+
+_STEPS = {
+    ASK_COUNTRY: _step_country,
+    ASK_METHOD: _step_method,
+    ASK_AMOUNT: _step_amount,
+    SHOW_OPTIONS: _step_options,
+    OFFER_BUDGET: _step_budget,
+}
+
+@replay_duplicate_turn
+def handle_remittance_turn(user_text: str, user_low: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `user_text` is the stripped user input and `user_low` its lowercase form (normalized once by the caller).
+    Returns dict: { text, used_backend, used_rag, sources, done }
+    """
+    user = user_text or ""
+    low = user_low or ""
+
+    step = _STEPS.get(state.get("flow_state", ASK_COUNTRY))
+    while step is not None:
+        out, state["flow_state"] = step(user, low, state)
+        if out is not None:
+            if state["flow_state"] == DONE:
+                state["flow"] = None
+            return out
+        step = _STEPS.get(state["flow_state"])
 
     state["flow_state"] = DONE
     state["flow"] = None
@@ -1,6 +1,8 @@
 # flows/scam_flow.py
 import re
 from typing import Dict, Any
+import ahocorasick
+from flows import replay_duplicate_turn
 from rag_backend import answer_query
 
 """
@@ -17,6 +19,17 @@ SCAM_INTENT_PATTERNS = [
     r"\b(MOM|ICA|police|bank) (call(ed)?|message(d)?|email(ed)?) me\b",
     r"\b(suspect|not sure|too good to be true)\b",
 ]
+# Case-sensitive on lowercased text (as the intent check always was), so the OTP / MOM|ICA
+# literals don't route general questions into this flow
+_SCAM_RE = re.compile("|".join(f"(?:{p})" for p in SCAM_INTENT_PATTERNS))
+_MONEY_RE = re.compile(r"\b(?:sgd|s\$|\$)?\s?\d{1,4}(?:[.,]\d{2})?\b", re.IGNORECASE | re.ASCII)
+# Cheap substring prefilter: every pattern match contains one of these (lowercased)
+SCAM_HOT_WORDS = (
+    "scam", "suspicious", "fraud", "cheat", "fake", "impersonat", "phishing",
+    "loan shark", "ah long", "fee", "deposit", "gift card", "crypto", "bitcoin",
+    "otp", "password", "bank account", "transfer now", "call", "message", "email",
+    "suspect", "not sure", "too good to be true",
+)
 
 ASK_SCENARIO   = "ask_scenario"
 ASK_CHANNEL    = "ask_channel"
@@ -50,6 +63,18 @@ REQUEST_KEYWORDS = [
     "nric", "passport", "work permit", "bank details", "account number"
 ]
 
+# CHANNEL_MAP / REQUEST_KEYWORDS as Aho-Corasick automatons, so each lookup is one pass over
+# the text. Payloads start with the key's list/dict position to keep the old priority/order.
+_CHANNEL_AC = ahocorasick.Automaton()
+for _i, (_k, _v) in enumerate(CHANNEL_MAP.items()):
+    _CHANNEL_AC.add_word(_k, (_i, _v))
+_CHANNEL_AC.make_automaton()
+
+_REQ_AC = ahocorasick.Automaton()
+for _i, _k in enumerate(REQUEST_KEYWORDS):
+    _REQ_AC.add_word(_k, (_i, _k))
+_REQ_AC.make_automaton()
+
 # Prefer these docs if they have safety sections
 _DOC_KEYS = (
     "mw handy guide english",
@@ -61,12 +86,26 @@ _DOC_KEYS = (
     "scam", "fraud", "phishing", "impersonation", "verify", "official",
     "otp", "password", "deposit", "upfront fee", "processing fee", "work permit"
 )
+_DOC_KEYS_FS = frozenset(_DOC_KEYS)
+
+# Risk-check prompt; only the slots are formatted per turn
+_SCAM_QUERY_TMPL = (
+    "Scam safety check for a migrant worker in Singapore. "
+    "Channel: {channel}. Key details: {scenario}. Requests mentioned: {requests}. "
+    "Identify **red flags** in bullet points, then give clear **DO/DON'T** steps in simple English. "
+    "Emphasize: do not share OTP/password, do not pay upfront fees or deposits to strangers, "
+    "verify with official channels directly, and stop contact if pressured. "
+    "Use uploaded context where relevant, for example 'mw handy guide english' or remittance/payment guides."
+)
 
-def is_scam_intent(text: str) -> bool:
+def is_scam_intent(text: str, low: str | None = None) -> bool:
     if not text:
         return False
-    low = text.lower()
-    return any(re.search(pat, low) for pat in SCAM_INTENT_PATTERNS)
+    if low is None:  # callers that already lowercased the turn's text pass it in
+        low = text.lower()
+    if not any(w in low for w in SCAM_HOT_WORDS):
+        return False
+    return _SCAM_RE.search(low) is not None
 
 def reset_scam_state(state: Dict[str, Any]) -> str:
     state["flow"] = "scam"
@@ -74,122 +113,126 @@ def reset_scam_state(state: Dict[str, Any]) -> str:
     state["scam_scenario"] = None
     state["scam_channel"] = None
     state["scam_requests"] = None
+    state["_last_turn"] = None
     return (
         "I’m here to help you stay safe. 🛡️\n\n"
         "**What happened?** Please describe the message/call/offer in your own words."
     )
 
-def _normalize_channel(text: str) -> str | None:
-    low = (text or "").lower()
-    for k, v in CHANNEL_MAP.items():
-        if k in low:
-            return v
-    return None
-
-def _extract_requests(text: str) -> list[str]:
-    low = (text or "").lower()
-    hits = []
-    for k in REQUEST_KEYWORDS:
-        if k in low:
-            hits.append(k)
-    amounts = re.findall(r"\b(?:sgd|s\$|\$)?\s?\d{1,4}(?:[.,]\d{2})?\b", low)
-    if amounts:
-        hits.extend([a.strip() for a in amounts])
-    return list(dict.fromkeys(hits))  # dedupe, preserve order
-
-def handle_scam_turn(user_text: str, state: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Returns dict: { text, used_backend, used_rag, sources, done }
-    """
-    cur = state.get("flow_state", ASK_SCENARIO)
-    user = (user_text or "").strip()
-
-    if cur == ASK_SCENARIO:
-        if not user:
-            return {
-                "text": "Please describe the situation (what was said/sent to you).",
-                "used_backend": False, "used_rag": False, "sources": [], "done": False
-            }
-        state["scam_scenario"] = user
-        state["flow_state"] = ASK_CHANNEL
+def _normalize_channel(low: str) -> str | None:
+    best = min((hit for _, hit in _CHANNEL_AC.iter(low)), default=None)
+    return best[1] if best else None
+
+def _extract_requests(low: str) -> list[str]:
+    # keyword hits (REQUEST_KEYWORDS order, already unique) then money amounts, deduped as we go
+    out = [k for _, k in sorted({hit for _, hit in _REQ_AC.iter(low)})]
+    seen = set(out)
+    for a in _MONEY_RE.findall(low):
+        a = a.strip()
+        if a and a not in seen:
+            seen.add(a)
+            out.append(a)
+    return out
+
+# FSM steps: (user, low, state) -> (reply or None, next flow_state); a None reply runs the
+# next state's step in the same turn.
+def _step_scenario(user: str, low: str, state: Dict[str, Any]):
+    if not user:
         return {
-            "text": "Where did this happen? (e.g., **SMS**, **WhatsApp**, **Phone call**, **Website**, **In-person agent**)",
+            "text": "Please describe the situation (what was said/sent to you).",
             "used_backend": False, "used_rag": False, "sources": [], "done": False
-        }
-
-    if cur == ASK_CHANNEL:
-        ch = _normalize_channel(user)
-        if not ch:
-            return {
-                "text": "Please tell me the channel: **SMS**, **WhatsApp/WeChat/Telegram**, **Phone call**, **Email/Website**, or **In-person agent**.",
-                "used_backend": False, "used_rag": False, "sources": [], "done": False
-            }
-        state["scam_channel"] = ch
-        state["flow_state"] = ASK_REQUESTS
+        }, ASK_SCENARIO
+    state["scam_scenario"] = user
+    return {
+        "text": "Where did this happen? (e.g., **SMS**, **WhatsApp**, **Phone call**, **Website**, **In-person agent**)",
+        "used_backend": False, "used_rag": False, "sources": [], "done": False
+    }, ASK_CHANNEL
+
+def _step_channel(user: str, low: str, state: Dict[str, Any]):
+    ch = _normalize_channel(low)
+    if not ch:
         return {
-            "text": (
-                "Thanks. Did they ask for anything like **money (upfront/fees)**, **bank details**, or your **OTP/passport**? "
-                "Feel free to paste exact wording. If nothing specific, you can say **not sure**."
-            ),
+            "text": "Please tell me the channel: **SMS**, **WhatsApp/WeChat/Telegram**, **Phone call**, **Email/Website**, or **In-person agent**.",
             "used_backend": False, "used_rag": False, "sources": [], "done": False
-        }
-
-    if cur == ASK_REQUESTS:
-        hits = _extract_requests(user)
-        state["scam_requests"] = hits or (["not sure"] if user.lower() == "not sure" else [])
-        state["flow_state"] = SUMMARIZE_RISK
-
-    if state.get("flow_state") == SUMMARIZE_RISK:
-        scenario = state.get("scam_scenario") or ""
-        channel  = state.get("scam_channel") or "Unknown channel"
-        requests = ", ".join(state.get("scam_requests") or []) or "No specific requests"
-        query = (
-            "Scam safety check for a migrant worker in Singapore. "
-            f"Channel: {channel}. Key details: {scenario}. Requests mentioned: {requests}. "
-            "Identify **red flags** in bullet points, then give clear **DO/DON'T** steps in simple English. "
-            "Emphasize: do not share OTP/password, do not pay upfront fees or deposits to strangers, "
-            "verify with official channels directly, and stop contact if pressured. "
-            "Use uploaded context where relevant, for example 'mw handy guide english' or remittance/payment guides."
-        )
-        res = answer_query(query, require_keywords=_DOC_KEYS)
-
-        state["flow_state"] = PROVIDE_STEPS
-        text = (
-            "**Let’s review this safely:**\n\n"
-            f"{res.get('answer','')}\n\n"
-            "If you like, I can also show **how to report** and where to get official help. Would you like that? (yes/no)"
+        }, ASK_CHANNEL
+    state["scam_channel"] = ch
+    return {
+        "text": (
+            "Thanks. Did they ask for anything like **money (upfront/fees)**, **bank details**, or your **OTP/passport**? "
+            "Feel free to paste exact wording. If nothing specific, you can say **not sure**."
+        ),
+        "used_backend": False, "used_rag": False, "sources": [], "done": False
+    }, ASK_REQUESTS
+
+def _step_requests(user: str, low: str, state: Dict[str, Any]):
+    hits = _extract_requests(low)
+    state["scam_requests"] = hits or (["not sure"] if low == "not sure" else [])
+    return None, SUMMARIZE_RISK
+
+def _step_summarize(user: str, low: str, state: Dict[str, Any]):
+    scenario = state.get("scam_scenario") or ""
+    channel  = state.get("scam_channel") or "Unknown channel"
+    requests = ", ".join(state.get("scam_requests") or []) or "No specific requests"
+    query = _SCAM_QUERY_TMPL.format(channel=channel, scenario=scenario, requests=requests)
+    res = answer_query(query, require_keywords=_DOC_KEYS_FS)
+
+    text = (
+        "**Let’s review this safely:**\n\n"
+        f"{res.get('answer','')}\n\n"
+        "If you like, I can also show **how to report** and where to get official help. Would you like that? (yes/no)"
+    )
+    return {
+        "text": text,
+        "used_backend": True, "used_rag": bool(res.get("used_rag")), "sources": res.get("sources", []),
+        "done": False
+    }, PROVIDE_STEPS
+
+def _step_provide(user: str, low: str, state: Dict[str, Any]):
+    if low in ("yes", "y", "yeah", "ok", "okay", "sure"):
+        tips = (
+            "Here are safe next steps:\n\n"
+            "1) **Stop contact** with the sender/caller. Do not click links or scan QR codes.\n"
+            "2) **Do not share** OTP, passwords, banking details, or ID images.\n"
+            "3) **Verify independently** with official sources (visit the agency/bank’s official site or hotline from their official page).\n"
+            "4) **Document** the evidence (screenshots, phone numbers, usernames) in case you need to report.\n"
+            "5) **Report** through official Singapore channels (e.g., national anti-scam resources or the police e-services portal). "
+            "Use only contacts listed on the official websites.\n"
+            "6) If you already sent money or shared details, **contact your bank immediately** to secure your account.\n"
         )
         return {
-            "text": text,
-            "used_backend": True, "used_rag": bool(res.get("used_rag")), "sources": res.get("sources", []),
-            "done": False
-        }
-
-    if state.get("flow_state") == PROVIDE_STEPS:
-        if user.lower() in ("yes", "y", "yeah", "ok", "okay", "sure"):
-            tips = (
-                "Here are safe next steps:\n\n"
-                "1) **Stop contact** with the sender/caller. Do not click links or scan QR codes.\n"
-                "2) **Do not share** OTP, passwords, banking details, or ID images.\n"
-                "3) **Verify independently** with official sources (visit the agency/bank’s official site or hotline from their official page).\n"
-                "4) **Document** the evidence (screenshots, phone numbers, usernames) in case you need to report.\n"
-                "5) **Report** through official Singapore channels (e.g., national anti-scam resources or the police e-services portal). "
-                "Use only contacts listed on the official websites.\n"
-                "6) If you already sent money or shared details, **contact your bank immediately** to secure your account.\n"
-            )
-            state["flow_state"] = DONE
-            state["flow"] = None
-            return {
-                "text": tips + "\nStay safe. You can ask me anything else anytime.",
-                "used_backend": False, "used_rag": False, "sources": [], "done": True
-            }
-        else:
-            state["flow_state"] = DONE
-            state["flow"] = None
-            return {
-                "text": "No problem. Stay safe — and feel free to ask anything else.",
-                "used_backend": False, "used_rag": False, "sources": [], "done": True
-            }
+            "text": tips + "\nStay safe. You can ask me anything else anytime.",
+            "used_backend": False, "used_rag": False, "sources": [], "done": True
+        }, DONE
+    return {
+        "text": "No problem. Stay safe — and feel free to ask anything else.",
+        "used_backend": False, "used_rag": False, "sources": [], "done": True
+    }, DONE
+
+_STEPS = {
+    ASK_SCENARIO: _step_scenario,
+    ASK_CHANNEL: _step_channel,
+    ASK_REQUESTS: _step_requests,
+    SUMMARIZE_RISK: _step_summarize,
+    PROVIDE_STEPS: _step_provide,
+}
+
+@replay_duplicate_turn
+def handle_scam_turn(user_text: str, user_low: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `user_text` is the stripped user input and `user_low` its lowercase form (normalized once by the caller).
+    Returns dict: { text, used_backend, used_rag, sources, done }
+    """
+    user = user_text or ""
+    low = user_low or ""
+
+    step = _STEPS.get(state.get("flow_state", ASK_SCENARIO))
+    while step is not None:
+        out, state["flow_state"] = step(user, low, state)
+        if out is not None:
+            if state["flow_state"] == DONE:
+                state["flow"] = None
+            return out
+        step = _STEPS.get(state["flow_state"])
 
     state["flow_state"] = DONE
     state["flow"] = None
@@ -1,13 +1,22 @@
 # rag_backend.py
-import os, json, requests
+import hashlib
+import io
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Collection, Iterator
+import ahocorasick
+import cachetools
+import orjson
 from dotenv import load_dotenv
-from langdetect import detect, DetectorFactory
 
-# llama-cloud-services
-from llama_cloud_services import LlamaCloudIndex
+# requests, langdetect and llama-cloud-services are imported on first use (see _http,
+# _langdetect, _get_index), so importing this module for the flows stays cheap.
+if TYPE_CHECKING:
+    from llama_cloud_services import LlamaCloudIndex
 
-# Make langdetect deterministic
-DetectorFactory.seed = 0
 load_dotenv()
 
 # === Config ===
@@ -16,6 +25,7 @@ LC_INDEX_NAME    = os.getenv("LLAMACLOUD_INDEX_NAME", "COR2221")
 LC_PROJECT_NAME  = os.getenv("LLAMACLOUD_PROJECT_NAME", "Default")
 LC_ORG_ID        = os.getenv("LLAMACLOUD_ORG_ID")
 TOP_K            = int(os.getenv("TOP_K", "4"))
+RETRIEVE_FANOUT  = int(os.getenv("RETRIEVE_FANOUT", "2"))  # extra keyword-focused queries per gated retrieval
 
 SEA_LION_API_KEY = os.getenv("SEA_LION_API_KEY")
 SEA_LION_BASE    = os.getenv("SEA_LION_BASE", "https://api.sea-lion.ai")
@@ -35,19 +45,54 @@ SUPPORTED_LANGS = {
 NOT_FOUND_TOKEN = "<<NOT_FOUND>>"
 FORCE_EN_QUERY = False
 
-# Cache the index
-_LC_INDEX = None
+_SEA_LION_URL = f"{SEA_LION_BASE}/v1/chat/completions"
+
+# One HTTP session for every SEA-LION call, so TCP/TLS connections are pooled and reused.
+# The auth headers live on the session; failed connects and transient 429/5xx replies are
+# retried with backoff. Read timeouts are not: the request may still be generating (and billed).
+@lru_cache(maxsize=1)
+def _http():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    session = requests.Session()
+    session.headers.update({"Authorization": f"Bearer {SEA_LION_API_KEY}", "Content-Type": "application/json"})
+    retry = Retry(total=2, connect=2, read=0, other=0, status=2, backoff_factor=0.2,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset({"POST"}), raise_on_status=False)
+    session.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=100, max_retries=retry))
+    return session
+
+# All 55 profiles stay loaded (once, ~0.3 s, on the first detection): with a subset, any other
+# language is forced onto a loaded one with ~100% confidence (Japanese -> zh, Spanish -> en),
+# and the model is told to answer in the wrong language instead of "the user's language".
+@lru_cache(maxsize=1)
+def _langdetect():
+    from langdetect import detect, DetectorFactory
+    DetectorFactory.seed = 0  # Make langdetect deterministic
+    return detect
+
+# Openings of the English prompt templates the flows send; those skip langdetect entirely
+_ENGLISH_TEMPLATE_PREFIXES = (
+    "Remittance guidance", "Budgeting tips", "Scam safety check for",
+    "Financial planning tips", "Step-by-step **bank account setup**",
+)
 
 def detect_lang(text: str) -> str:
+    if text.startswith(_ENGLISH_TEMPLATE_PREFIXES):
+        return "en"
+    # the first 128 chars are enough to tell the language, and make repeat phrasings cache hits
+    return _detect_lang_cached(text[:128])
+
+@lru_cache(maxsize=2048)
+def _detect_lang_cached(text: str) -> str:
     try:
-        code = detect(text)
+        code = _langdetect()(text)
     except Exception:
         return "en"
     return "zh" if code.startswith("zh") else code
 
 def _sealion_chat(messages, temperature=0.2, max_tokens=1024) -> str:
-    url = f"{SEA_LION_BASE}/v1/chat/completions"
-    headers = {"Authorization": f"Bearer {SEA_LION_API_KEY}", "Content-Type": "application/json"}
     payload = {
         "model": SEA_LION_MODEL,
         "messages": messages,
@@ -55,11 +100,36 @@ def _sealion_chat(messages, temperature=0.2, max_tokens=1024) -> str:
         "max_tokens": int(max_tokens),
         "max_completion_tokens": int(max_tokens),
     }
-    r = requests.post(url, headers=headers, json=payload, timeout=DEFAULT_TIMEOUT)
+    # orjson both ways: the RAG payload carries the whole context (tens of KB)
+    r = _http().post(_SEA_LION_URL, data=orjson.dumps(payload), timeout=DEFAULT_TIMEOUT)
     r.raise_for_status()
-    data = r.json()
+    data = orjson.loads(r.content)
     return (data.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
 
+def _sealion_chat_stream(messages, temperature=0.2, max_tokens=1024) -> Iterator[str]:
+    """Same request as _sealion_chat with "stream": true; yields content deltas from the SSE frames."""
+    payload = {
+        "model": SEA_LION_MODEL,
+        "messages": messages,
+        "temperature": float(temperature),
+        "max_tokens": int(max_tokens),
+        "max_completion_tokens": int(max_tokens),
+        "stream": True,
+    }
+    with _http().post(_SEA_LION_URL, data=orjson.dumps(payload), timeout=DEFAULT_TIMEOUT, stream=True) as r:
+        r.raise_for_status()
+        # raw bytes: text/event-stream without a charset would be decoded as ISO-8859-1 by
+        # requests (garbling non-Latin replies); orjson decodes the UTF-8 JSON itself
+        for line in r.iter_lines():
+            if not line or not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            delta = (orjson.loads(data).get("choices") or [{}])[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
 def translate_with_sealion(text: str, target_lang_code: str) -> str:
     lang_name = SUPPORTED_LANGS.get(target_lang_code, target_lang_code)
     sys_prompt = (
@@ -69,59 +139,114 @@ def translate_with_sealion(text: str, target_lang_code: str) -> str:
     messages = [{"role": "system", "content": sys_prompt}, {"role": "user", "content": text}]
     return _sealion_chat(messages, temperature=0.0, max_tokens=1024)
 
-def _get_index() -> LlamaCloudIndex:
-    global _LC_INDEX
-    if _LC_INDEX is None:
-        _LC_INDEX = LlamaCloudIndex(
-            name=LC_INDEX_NAME,
-            project_name=LC_PROJECT_NAME,
-            organization_id=LC_ORG_ID,
-            api_key=LC_SDK_API_KEY,
-        )
-    return _LC_INDEX
+# Cache the index (one client per process, with its auth and HTTP session)
+@lru_cache(maxsize=1)
+def _get_index() -> "LlamaCloudIndex":
+    from llama_cloud_services import LlamaCloudIndex
+    return LlamaCloudIndex(
+        name=LC_INDEX_NAME,
+        project_name=LC_PROJECT_NAME,
+        organization_id=LC_ORG_ID,
+        api_key=LC_SDK_API_KEY,
+    )
 
 def retrieve_context(query: str, top_k: int = TOP_K):
-    try:
-        nodes = _get_index().as_retriever().retrieve(query)
-    except Exception as e:
-        print(f"[retrieve warn] {e}")
-        return [], []
-    nodes = list(nodes)[:int(top_k)]
+    """
+    Returns (ctx, ctx_lower, srcs): chunk texts, the same texts lowercased (computed once here
+    for the keyword filters) and their source names.
+    """
+    # Repeated questions (greetings, common pass questions) are answered from the cache. The key
+    # is the case/whitespace-normalized query; the retriever still gets the original text, since
+    # case carries meaning here (MOM, EP, ICA, POSB).
+    key = (" ".join(query.lower().split()), int(top_k))
+    with _RETRIEVE_LOCK:
+        hit = _RETRIEVE_CACHE.get(key)
+    if hit is None:
+        try:
+            hit = _retrieve(query, int(top_k))
+        except Exception as e:
+            print(f"[retrieve warn] {e}")  # failures aren't cached, so the next turn retries
+            return [], [], []
+        with _RETRIEVE_LOCK:
+            _RETRIEVE_CACHE[key] = hit
+    ctx, ctx_lower, srcs = hit
+    return list(ctx), list(ctx_lower), list(srcs)
+
+def retrieve_many(queries: list[str], top_k: int = TOP_K, max_chunks: int | None = None):
+    """
+    retrieve_context for several queries at once (the round-trips overlap). Results are merged
+    rank by rank (every query's best hit first), deduplicated by chunk text and cut to
+    `max_chunks` (default: 2 * top_k). Returns (ctx, ctx_lower, srcs) like retrieve_context.
+    """
+    max_chunks = 2 * top_k if max_chunks is None else max_chunks
+    with ThreadPoolExecutor(max_workers=max(1, len(queries))) as pool:
+        results = list(pool.map(lambda q: retrieve_context(q, top_k), queries))
+    ctx, ctx_lower, srcs, seen = [], [], [], set()
+    for rank in range(max((len(r[0]) for r in results), default=0)):
+        for r_ctx, r_lower, r_srcs in results:
+            if rank < len(r_ctx) and r_ctx[rank] not in seen:
+                seen.add(r_ctx[rank])
+                ctx.append(r_ctx[rank]); ctx_lower.append(r_lower[rank]); srcs.append(r_srcs[rank])
+    return ctx[:max_chunks], ctx_lower[:max_chunks], srcs[:max_chunks]
+
+_RETRIEVE_CACHE = cachetools.LRUCache(maxsize=1024)  # (normalized query, top_k) -> _retrieve result
+_RETRIEVE_LOCK = threading.Lock()
+
+def _retrieve(query: str, top_k: int) -> tuple[tuple[str, ...], tuple[str, ...], tuple[str, ...]]:
+    from llama_index.core.schema import NodeWithScore  # installed with llama-cloud-services
+    nodes = _get_index().as_retriever().retrieve(query)
+    nodes = list(nodes)[:top_k]
     ctx, srcs = [], []
     for n in nodes:
-        text = getattr(n, "text", None) or (getattr(n, "node", {}) or {})
-        if isinstance(text, dict):
-            text = text.get("text", "")
-        text = (text or "")
-        md = getattr(n, "metadata", None)
-        if md is None and hasattr(n, "node") and isinstance(n.node, dict):
-            md = n.node.get("metadata")
+        if isinstance(n, NodeWithScore):  # what the retriever returns: read the node directly
+            text, md = n.node.get_content(), n.node.metadata
+        else:
+            text = getattr(n, "text", None) or (getattr(n, "node", {}) or {})
+            if isinstance(text, dict):
+                text = text.get("text", "")
+            md = getattr(n, "metadata", None)
+            if md is None and hasattr(n, "node") and isinstance(n.node, dict):
+                md = n.node.get("metadata")
+        text = (text or "").strip()
         src = "unknown"
         if isinstance(md, dict):
             src = md.get("file_name") or md.get("source") or md.get("document_id") or "unknown"
-        if text.strip():
-            ctx.append(text.strip()); srcs.append(str(src))
-    return ctx, srcs
+        if text:
+            ctx.append(text); srcs.append(str(src))
+    return tuple(ctx), tuple(c.lower() for c in ctx), tuple(srcs)
+
+_CHUNK_SEP = "\n\n---\n\n"
 
 def clamp_context(chunks, max_chars=48000):
-    out, total = [], 0
+    # chunks come stripped from retrieve_context; the output is written in one pass
+    buf, total = io.StringIO(), 0
     for c in chunks:
-        c = (c or "").strip()
         if not c: continue
-        if total + len(c) > max_chars:
+        piece = (_CHUNK_SEP + c) if total else c
+        if total + len(piece) > max_chars:
             rest = max_chars - total
-            if rest > 0: out.append(c[:rest] + " ...[truncated]...")
+            if rest > 0: buf.write(piece[:rest]); buf.write(" ...[truncated]...")
             break
-        out.append(c); total += len(c)
-    return "\n\n---\n\n".join(out)
-
-def filter_context(chunks, include_any=()):
+        buf.write(piece); total += len(piece)
+    return buf.getvalue()
+
+@lru_cache(maxsize=32)
+def _keyword_automaton(keys: frozenset) -> ahocorasick.Automaton:
+    """Lowercased keyword gate as an Aho-Corasick automaton; built once per distinct key set."""
+    ac = ahocorasick.Automaton()
+    for k in keys:
+        ac.add_word(k.lower(), k)
+    ac.make_automaton()
+    return ac
+
+def _keyword_hits(chunks_lower, include_any):
+    """Indices of the chunks (given lowercased) containing ANY of the keywords."""
+    ac = _keyword_automaton(frozenset(include_any))  # one pass per chunk for all keys
+    return [i for i, low in enumerate(chunks_lower) if next(ac.iter(low), None) is not None]
+
+def filter_context(chunks, chunks_lower, include_any=()):
     if not include_any: return chunks
-    keys = [k.lower() for k in include_any]
-    sel = []
-    for c in chunks:
-        low = (c or "").lower()
-        if any(k in low for k in keys): sel.append(c)
+    sel = [chunks[i] for i in _keyword_hits(chunks_lower, include_any)]
     return sel or chunks
 
 def make_rag_prompt_strict(context_text: str, answer_lang_code: str, not_found_token: str = NOT_FOUND_TOKEN) -> str:
@@ -130,7 +255,15 @@ def make_rag_prompt_strict(context_text: str, answer_lang_code: str, not_found_t
     - Uses ONLY the supplied context_text for facts.
     - If insufficient, must return exactly the NOT_FOUND token.
     - Forces a short quote from context and inline filename citations.
+    The rules come first and are identical for every call in a language, so they form a stable
+    prompt prefix (cacheable on the model side); only the context block after them changes.
+    It stays a single system message: Gemma's chat template rejects a second one.
     """
+    return f"{_rag_rules_prompt(answer_lang_code, not_found_token)}\nCONTEXT START\n{context_text}\nCONTEXT END\n"
+
+@lru_cache(maxsize=16)
+def _rag_rules_prompt(answer_lang_code: str, not_found_token: str) -> str:
+    # only depends on the language (and token), so it is built once per language
     lang_name = SUPPORTED_LANGS.get(answer_lang_code, "the user's language")
 
     return (
@@ -148,11 +281,11 @@ def make_rag_prompt_strict(context_text: str, answer_lang_code: str, not_found_t
         "- One-sentence summary.\n"
         "- Numbered steps (only if steps exist in CONTEXT).\n"
         '- Include one short quote from CONTEXT in double quotes and add a source like [filename].\n'
-        "- Optional: a single sentence of caution if (and only if) it appears in CONTEXT.\n\n"
-        f"CONTEXT START\n{context_text}\nCONTEXT END\n"
+        "- Optional: a single sentence of caution if (and only if) it appears in CONTEXT.\n"
     )
 
 
+@lru_cache(maxsize=16)  # no per-request parts: one prompt per language
 def make_general_prompt(answer_lang_code: str) -> str:
     """
     Drop-in general system prompt targeted at migrant workers in Singapore.
@@ -184,21 +317,17 @@ def make_general_prompt(answer_lang_code: str) -> str:
         "5) One small follow-up question to tailor help (language preference, bank/app choice, budget, home country for remittance).\n"
     )
 
-def answer_query(
-    user_raw: str,
-    require_keywords: tuple[str, ...] = (),
-    force_general: bool = False
-) -> dict:
+# Questions mentioning an S Pass or Employment Pass get their context narrowed to pass chunks
+_PASS_RE = re.compile(r"\b(?:s[\s-]?pass|employment\s+pass|ep)\b", re.IGNORECASE)
+_PASS_FOCUS = frozenset({"s pass", "employment pass", "ep"})
+
+def _prepare_context(user_raw: str, require_keywords: Collection[str], force_general: bool, user_lang: str | None = None):
     """
-    Returns a dict:
-    {
-      "answer": str,
-      "used_rag": bool,
-      "sources": [str],
-      "fallback_used": bool
-    }
+    Shared first half of answer_query / answer_query_stream: language detection (unless
+    `user_lang` is given), retrieval and keyword gating. Returns (user_lang, ctx_chunks, srcs, context).
     """
-    user_lang = detect_lang(user_raw)
+    if user_lang is None:
+        user_lang = detect_lang(user_raw)
     query_for_retrieval = user_raw
     if FORCE_EN_QUERY and user_lang != "en":
         try:
@@ -207,7 +336,19 @@ def answer_query(
             print(f"[translate warn] {e}; using original text.")
 
     # 1) Retrieve
-    ctx_chunks, srcs = retrieve_context(query_for_retrieval, TOP_K)
+    focus = ()
+    if require_keywords and not force_general and RETRIEVE_FANOUT > 0:
+        # Gated calls also retrieve with a few keyword-focused variants, concurrently, for better
+        # recall at about the same latency. Only keywords the query doesn't already spell out
+        # (the flow prompts name their doc titles) add anything; the merged context is capped
+        # at 2 * TOP_K chunks.
+        q_low = query_for_retrieval.lower()
+        focus = sorted((k for k in require_keywords if k.lower() not in q_low), key=lambda k: (-len(k), k))[:RETRIEVE_FANOUT]
+    if focus:
+        queries = [query_for_retrieval] + [f"{query_for_retrieval} {kw}" for kw in focus]
+        ctx_chunks, ctx_lower, srcs = retrieve_many(queries, TOP_K)
+    else:
+        ctx_chunks, ctx_lower, srcs = retrieve_context(query_for_retrieval, TOP_K)
 
     # 2) OPTIONAL GATE: caller can require certain keywords to appear in retrieved chunks
     #    - If require_keywords is provided and none of the chunks contain them -> disable RAG (force fallback)
@@ -215,90 +356,227 @@ def answer_query(
     if force_general:
         ctx_chunks = []
     elif require_keywords:
-        # filter_context keeps only chunks containing ANY of the keywords; returns original if none match,
-        # so we must manually empty when there's no match to force fallback.
-        filtered = filter_context(ctx_chunks, include_any=tuple(k.lower() for k in require_keywords))
-        # Detect "no match" by checking if filtered == original but none of the keywords are in any chunk.
-        if filtered is ctx_chunks:
-            # verify no keyword present at all
-            any_hit = any(
-                any(k.lower() in (c or "").lower() for k in require_keywords)
-                for c in ctx_chunks
-            )
-            if not any_hit:
-                ctx_chunks = []  # nothing relevant -> skip RAG
-        else:
-            ctx_chunks = filtered
+        # Keep only chunks containing ANY of the keywords (one automaton pass per chunk);
+        # if none match, the list ends up empty and RAG is skipped.
+        ctx_chunks = [ctx_chunks[i] for i in _keyword_hits(ctx_lower, require_keywords)]
 
     # 3) EP/S Pass focusing (only for the pass domain; avoid biasing other domains like scams)
-    if not force_general and not require_keywords:
-        focus_terms, ur_low = [], user_raw.lower()
-        if "s pass" in ur_low or "spass" in ur_low or " s-pass" in ur_low:
-            focus_terms += ["s pass", "employment pass", "ep"]
-        if "employment pass" in ur_low or (" ep " in f" {ur_low} "):
-            focus_terms += ["employment pass", "ep", "s pass"]
-        if focus_terms:
-            ctx_chunks = filter_context(ctx_chunks, include_any=tuple(set(focus_terms)))
+    if not force_general and not require_keywords and _PASS_RE.search(user_raw):
+        ctx_chunks = filter_context(ctx_chunks, ctx_lower, include_any=_PASS_FOCUS)
 
     context = clamp_context(ctx_chunks, max_chars=48000)
-
-    # 4) STRICT RAG pass (only if we still have context after the gate)
-    used_rag = False
-    if ctx_chunks:
-        sys_prompt = make_rag_prompt_strict(context, user_lang)
-        rag_msgs = [{"role": "system", "content": sys_prompt},
-                    {"role": "user", "content": user_raw}]
-        rag_ans = _sealion_chat(rag_msgs, temperature=0.0, max_tokens=1024)
-        if rag_ans:
-            text = rag_ans.strip()
-
-            # Treat common "refusal/explanation" patterns as NOT_FOUND, so we fall back.
-            refusal_patterns = (
-                "does not contain", "not contain information",
-                "outside the scope", "not present in the context",
-                "context focuses on", "cannot find", "insufficient",
-                "<<>>", "<>",  # any placeholder noise
-            )
-            looks_like_refusal = any(pat in text.lower() for pat in refusal_patterns)
-
-            if text != NOT_FOUND_TOKEN and not looks_like_refusal:
-                used_rag = True
-                return {"answer": text, "used_rag": True, "sources": srcs, "fallback_used": False}
-
-    # 5) Fallback (general knowledge)
+    return user_lang, ctx_chunks, srcs, context
+
+# Phrases the model uses when it declines despite the NOT_FOUND instruction, plus placeholder noise;
+# one case-insensitive scan of the reply, no lowercased copy
+_REFUSAL_RE = re.compile(
+    "|".join(map(re.escape, (
+        "does not contain", "not contain information",
+        "outside the scope", "not present in the context",
+        "context focuses on", "cannot find", "insufficient",
+        "<<>>", "<>",
+    ))),
+    re.IGNORECASE,
+)
+
+def _strict_rag_messages(user_raw: str, user_lang: str, context: str):
+    sys_prompt = make_rag_prompt_strict(context, user_lang)
+    return [{"role": "system", "content": sys_prompt},
+            {"role": "user", "content": user_raw}]
+
+def _declined(text: str) -> bool:
+    # Treat NOT_FOUND and common "refusal/explanation" patterns as a decline, so we fall back.
+    return not text or text == NOT_FOUND_TOKEN or _REFUSAL_RE.search(text) is not None
+
+# Short-lived reply cache shared by all sessions: a question asked again (refresh, another user)
+# with the same retrieved context is answered from memory instead of another SEA-LION call.
+# Keys: ("rag", query, context hash, lang) and ("fb", query, lang); only real answers are stored.
+_ANS_CACHE = cachetools.TTLCache(maxsize=1024, ttl=600)
+_ANS_LOCK = threading.Lock()
+# Whole answer_query results (grounded ones only), keyed by (prompt, keyword set, mode)
+_ANSWER_CACHE = cachetools.TTLCache(maxsize=512, ttl=600)
+
+def _rag_key(user_raw: str, user_lang: str, context: str) -> tuple:
+    ctx_hash = hashlib.blake2b(context.encode(), digest_size=16).hexdigest()
+    return ("rag", " ".join(user_raw.lower().split()), ctx_hash, user_lang)
+
+def _fallback_key(user_raw: str, user_lang: str) -> tuple:
+    return ("fb", " ".join(user_raw.lower().split()), user_lang)
+
+def _cached_reply(key: tuple) -> str | None:
+    with _ANS_LOCK:
+        return _ANS_CACHE.get(key)
+
+def _store_reply(key: tuple, text: str) -> None:
+    if text:
+        with _ANS_LOCK:
+            _ANS_CACHE[key] = text
+
+def _strict_rag_answer(user_raw: str, user_lang: str, context: str) -> str | None:
+    """Run the strict RAG pass; returns the answer, or None if the model declined."""
+    key = _rag_key(user_raw, user_lang, context)
+    text = _cached_reply(key)
+    if text is not None:
+        return text
+    rag_ans = _sealion_chat(_strict_rag_messages(user_raw, user_lang, context), temperature=0.0, max_tokens=1024)
+    text = (rag_ans or "").strip()
+    if _declined(text):
+        return None
+    _store_reply(key, text)
+    return text
+
+def _general_reply(gen_msgs: list, key: tuple) -> str:
+    """General-knowledge reply (the speculative fallback task), served from/stored in the reply cache."""
+    text = _cached_reply(key)
+    if text is None:
+        text = _sealion_chat(gen_msgs, temperature=0.2, max_tokens=1024)
+        _store_reply(key, text)
+    return text
+
+# How much of a streamed strict-RAG reply is held back and checked for a decline before any of it
+# is shown; NOT_FOUND and the refusal phrasings show up at the start of the reply
+_RAG_HEAD_CHARS = 160
+
+def _fallback_messages(user_raw: str, user_lang: str, had_context: bool):
     general_sys = make_general_prompt(user_lang)
     gen_msgs = [{"role": "system", "content": general_sys}, {"role": "user", "content": user_raw}]
-    general_reply = _sealion_chat(gen_msgs, temperature=0.2, max_tokens=1024)
     fallback_notice = ""
-    if ctx_chunks:  # we had context but chose not to use it (or it wasn't sufficient)
+    if had_context:  # we had context but chose not to use it (or it wasn't sufficient)
         fallback_notice = (
             "\n⚠️ *Fallback Notice:*\n"
             "The uploaded context did not contain enough information to fully answer your question.\n"
             "Here’s a **general overview** based on public knowledge instead:\n\n"
         )
-    return {
-        "answer": fallback_notice + general_reply,
-        "used_rag": False,
-        "sources": srcs,
-        "fallback_used": True
+    return gen_msgs, fallback_notice
+
+def answer_query(
+    user_raw: str,
+    require_keywords: Collection[str] = (),
+    force_general: bool = False
+) -> dict:
+    """
+    Returns a dict:
+    {
+      "answer": str,
+      "used_rag": bool,
+      "sources": [str],
+      "fallback_used": bool
     }
+    Grounded answers to identical calls (same prompt, keyword set and mode) are served from an
+    in-process TTL cache; fallbacks aren't cached, so a retrieval outage isn't remembered.
+    """
+    key = (user_raw, frozenset(require_keywords), force_general)
+    with _ANS_LOCK:
+        res = _ANSWER_CACHE.get(key)
+    if res is None:
+        res = _answer_query_uncached(user_raw, key[1], force_general)
+        if res["used_rag"]:
+            with _ANS_LOCK:
+                _ANSWER_CACHE[key] = res
+    # callers get their own copy, so the cached entry can't be mutated through them
+    return {**res, "sources": list(res["sources"])}
+
+@lru_cache(maxsize=1)
+def _speculation_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="sealion-fallback")
+
+def answer_queries(
+    queries: list[str],
+    require_keywords: Collection[str] = (),
+    force_general: bool = False
+) -> list[dict]:
+    """
+    answer_query for several prompts at once. Each prompt's retrieval + LLM round-trips run
+    concurrently, so the batch costs about one call's latency; results come back in order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(queries))) as pool:
+        return list(pool.map(lambda q: answer_query(q, require_keywords, force_general), queries))
 
+def _answer_query_uncached(user_raw: str, require_keywords: frozenset, force_general: bool) -> dict:
+    # The general-knowledge reply doesn't depend on retrieval, so it is requested speculatively
+    # right away: on a RAG miss the turn then costs max(retrieve + RAG, fallback) instead of the sum.
+    # On a RAG hit the speculative reply is simply dropped.
+    user_lang = detect_lang(user_raw)
+    gen_msgs, _ = _fallback_messages(user_raw, user_lang, False)
+    speculative = _speculation_pool().submit(_general_reply, gen_msgs, _fallback_key(user_raw, user_lang))
 
+    user_lang, ctx_chunks, srcs, context = _prepare_context(user_raw, require_keywords, force_general, user_lang)
 
-    # Fallback
-    general_sys = make_general_prompt(user_lang)
-    gen_msgs = [{"role": "system", "content": general_sys}, {"role": "user", "content": user_raw}]
-    general_reply = _sealion_chat(gen_msgs, temperature=0.2, max_tokens=1024)
-    fallback_notice = ""
+    # 4) STRICT RAG pass (only if we still have context after the gate)
     if ctx_chunks:
-        fallback_notice = (
-            "\n⚠️ *Fallback Notice:*\n"
-            "The uploaded context did not contain enough information to fully answer your question.\n"
-            "Here’s a **general overview** based on public knowledge instead:\n\n"
-        )
+        text = _strict_rag_answer(user_raw, user_lang, context)
+        if text is not None:
+            speculative.cancel()  # no-op if the request is already in flight
+            return {"answer": text, "used_rag": True, "sources": srcs, "fallback_used": False}
+
+    # 5) Fallback (general knowledge)
+    _, fallback_notice = _fallback_messages(user_raw, user_lang, bool(ctx_chunks))
+    general_reply = speculative.result()
     return {
         "answer": fallback_notice + general_reply,
         "used_rag": False,
         "sources": srcs,
         "fallback_used": True
     }
+
+
+def answer_query_stream(
+    user_raw: str,
+    require_keywords: Collection[str] = (),
+    force_general: bool = False,
+    info: dict | None = None
+) -> Iterator[str]:
+    """
+    Streaming variant of answer_query: yields answer text chunks as they arrive.
+    The strict RAG reply is streamed too: its first _RAG_HEAD_CHARS are held back and checked for
+    NOT_FOUND/refusals, then the rest is passed through. While that runs, the general-knowledge
+    fallback is requested speculatively, so a decline switches to an answer that is (nearly) ready.
+    Without context the fallback is streamed token by token.
+    If `info` is given it is filled with "used_rag", "sources" and "fallback_used".
+    """
+    info = {} if info is None else info
+    user_lang, ctx_chunks, srcs, context = _prepare_context(user_raw, require_keywords, force_general)
+    info.update(used_rag=False, sources=srcs, fallback_used=False)
+    gen_msgs, fallback_notice = _fallback_messages(user_raw, user_lang, bool(ctx_chunks))
+
+    fb_key = _fallback_key(user_raw, user_lang)
+    if ctx_chunks:
+        rag_key = _rag_key(user_raw, user_lang, context)
+        cached = _cached_reply(rag_key)
+        if cached is not None:
+            info["used_rag"] = True
+            yield cached
+            return
+        speculative = _speculation_pool().submit(_general_reply, gen_msgs, fb_key)
+        rag = _sealion_chat_stream(_strict_rag_messages(user_raw, user_lang, context), temperature=0.0, max_tokens=1024)
+        head = ""
+        for tok in rag:
+            head += tok
+            if len(head) >= _RAG_HEAD_CHARS:
+                break
+        if not _declined(head.strip()):
+            speculative.cancel()  # no-op if the request is already in flight
+            info["used_rag"] = True
+            parts = [head.lstrip()]
+            yield parts[0]
+            for tok in rag:
+                parts.append(tok)
+                yield tok
+            _store_reply(rag_key, "".join(parts).strip())  # only reached if the reply was read to the end
+            return
+        rag.close()  # stop reading the declined reply
+        info["fallback_used"] = True
+        yield fallback_notice
+        yield speculative.result()
+        return
+
+    info["fallback_used"] = True
+    cached = _cached_reply(fb_key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    for tok in _sealion_chat_stream(gen_msgs, temperature=0.2, max_tokens=1024):
+        parts.append(tok)
+        yield tok
+    _store_reply(fb_key, "".join(parts))